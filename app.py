@@ -1,7 +1,10 @@
 
-import os, shutil, subprocess, tempfile, time, sys
+import os, csv, errno, shutil, subprocess, tempfile, time, sys, asyncio, zlib
+from functools import lru_cache
+from itertools import count, product
+from contextlib import asynccontextmanager
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 
 # ---------------- Utilities ----------------
@@ -13,9 +16,58 @@ def human_size(b):
         b /= 1024
     return f"{b:.1f} PB"
 
+RESULT_COLUMNS = ["file","before","after","saved_pct","status","note","output","backup"]
+RESULT_DTYPES = {"before": "int64", "after": "int64", "saved_pct": "float32"}
+REPORT_FLUSH_EVERY = 50  # rows between report flushes
+DISPLAY_MAX_ROWS = 5000  # results table cap; the CSV report is never truncated
+
+SIZE_UNITS = ["B","KB","MB","GB","TB","PB"]
+
+def human_sizes(values):
+    # Vectorized human_size for a whole column of byte counts
+    import numpy as np
+    b = np.asarray(values, dtype=np.float64)
+    idx = np.clip(np.log2(np.maximum(b, 1)).astype(int) // 10, 0, len(SIZE_UNITS) - 1)
+    val = b / (1024.0 ** idx)
+    return np.char.add(np.char.mod("%.1f ", val), np.array(SIZE_UNITS)[idx])
+
+def results_frame(rows):
+    # Display table for result dicts: fixed columns and dtypes, human-readable sizes
+    import pandas as pd
+    df = pd.DataFrame.from_records(rows, columns=RESULT_COLUMNS).astype(RESULT_DTYPES)
+    df["before"] = human_sizes(df["before"].to_numpy())
+    df["after"] = human_sizes(df["after"].to_numpy())
+    return df
+
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
+FICLONE = 0x40049409  # Linux ioctl: reflink clone on Btrfs/XFS
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def clone_file(src: Path, dst: Path):
+    # Hardlink is safe for backups: gs output replaces the original via a new inode,
+    # so the backup keeps the old bytes. Then reflink, then a real copy.
+    # dst is never opened if it exists: writing through an existing hardlink
+    # would overwrite whatever file it points at.
+    try:
+        os.link(src, dst); return
+    except FileExistsError:
+        raise
+    except OSError:
+        pass
+    with open(src, "rb") as fs, open(dst, "xb") as fd:
+        try:
+            if not fcntl: raise OSError("no reflink support")
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError:
+            shutil.copyfileobj(fs, fd, 1024*1024)
+    shutil.copystat(src, dst)
+
 def normalize_paths(raw: str):
     # Split by comma, strip quotes/spaces, expand user, resolve
     items = []
@@ -25,38 +77,68 @@ def normalize_paths(raw: str):
         items.append(p)
     return items
 
+# Every casing of ".pdf": str.endswith on a tuple avoids a lower() copy per filename
+PDF_SUFFIXES = tuple("." + "".join(c) for c in product("pP", "dD", "fF"))
+
+def _walk_pdfs(d, errors):
+    # Yields (path, size). DirEntry.is_dir()/is_file() reuse the type info from readdir,
+    # and DirEntry.stat() is cached (free on Windows), so compression never re-stats.
+    try:
+        with os.scandir(d) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    yield from _walk_pdfs(e.path, errors)
+                elif e.name.endswith(PDF_SUFFIXES) and e.is_file():
+                    try:
+                        yield e.path, e.stat().st_size
+                    except OSError as err:
+                        errors.append(f"{e.path}: {err}")  # skip this file, keep the folder
+    except OSError:
+        return  # unreadable subfolder: skip it, same as os.walk
+
+def _scan_root(p: Path, recursive=True):
+    found, errors = [], []
+    try:
+        if p.is_file() and p.suffix.lower() == ".pdf":
+            found.append((p, p.stat().st_size))
+        elif p.is_dir():
+            if recursive:
+                found.extend(_walk_pdfs(p, errors))
+            else:
+                for fn in os.listdir(p):
+                    if fn.endswith(PDF_SUFFIXES):
+                        try:
+                            found.append((p / fn, (p / fn).stat().st_size))
+                        except OSError as err:
+                            errors.append(f"{p / fn}: {err}")
+        else:
+            errors.append(f"Path not found or not accessible: {p}")
+    except Exception as e:
+        errors.append(f"{p}: {e}")
+    return found, errors
+
 def scan_pdfs(paths, recursive=True):
     found = []
     errors = []
-    for p in paths:
-        try:
-            if p.is_file() and p.suffix.lower() == ".pdf":
-                found.append(p.resolve())
-            elif p.is_dir():
-                if recursive:
-                    for root, _, files in os.walk(p):
-                        for fn in files:
-                            if fn.lower().endswith(".pdf"):
-                                found.append(Path(root) / fn)
-                else:
-                    for fn in os.listdir(p):
-                        if fn.lower().endswith(".pdf"):
-                            found.append(p / fn)
-            else:
-                errors.append(f"Path not found or not accessible: {p}")
-        except Exception as e:
-            errors.append(f"{p}: {e}")
+    # Walk each root on its own thread so readdir calls on separate disks overlap
+    if paths:
+        with ThreadPoolExecutor(max_workers=min(8, len(paths))) as ex:
+            for f, errs in ex.map(lambda p: _scan_root(p, recursive), paths):
+                found.extend(f)
+                errors.extend(errs)
     # Deduplicate
     uniq = []
     seen = set()
-    for f in found:
-        rp = str(Path(f).resolve())
+    for f, size in found:
+        rp = os.path.realpath(f)  # the only resolve per file
         if rp not in seen:
-            uniq.append(Path(rp))
             seen.add(rp)
+            uniq.append((Path(rp), size))
     return uniq, errors
 
+@lru_cache(maxsize=1)
 def has_ghostscript():
+    # Probed once per process; compress_one calls this for every file
     try:
         cmd = ["gswin64c" if os.name == "nt" else "gs", "-v"]
         subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
@@ -70,49 +152,137 @@ try:
 except Exception:
     pikepdf = None
 
-def ghostscript_compress(src: Path, dst: Path, preset: str, dpi: int = 150):
-    gs = "gswin64c" if os.name == "nt" else "gs"
+try:
+    import psutil
+except Exception:
+    psutil = None
+
+def default_workers():
+    # gs saturates a core per process, so one per physical core; pikepdf waits on zlib/IO, so oversubscribe
+    logical = os.cpu_count() or 1
+    physical = (psutil.cpu_count(logical=False) if psutil else None) or logical
+    return max(1, min(16, physical if has_ghostscript() else 2 * logical))
+
+GS = "gswin64c" if os.name == "nt" else "gs"
+GS_BATCH_SIZE = 8  # max PDFs handled by one warmed-up gs process
+SKIP_THRESHOLD = 200 * 1024  # default: smaller PDFs are not worth a gs run
+
+def _gs_args(preset: str, dpi: int = 150):
     if preset == "lossless":
-        cmd = [gs, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
-               "-dPDFSETTINGS=/default", "-dDetectDuplicateImages=true",
-               "-dNOPAUSE","-dQUIET","-dBATCH", f"-sOutputFile={str(dst)}", str(src)]
+        return ["-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
+                "-dPDFSETTINGS=/default", "-dDetectDuplicateImages=true",
+                "-dNOPAUSE","-dQUIET","-dBATCH"]
     elif preset == "balanced":
-        cmd = [gs, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
-               "-dPDFSETTINGS=/printer", "-dDetectDuplicateImages=true",
-               "-dNOPAUSE","-dQUIET","-dBATCH", f"-sOutputFile={str(dst)}", str(src)]
+        return ["-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
+                "-dPDFSETTINGS=/printer", "-dDetectDuplicateImages=true",
+                "-dNOPAUSE","-dQUIET","-dBATCH"]
     elif preset == "aggressive":
-        cmd = [gs, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
-               "-dPDFSETTINGS=/screen", "-dDetectDuplicateImages=true",
-               "-dNOPAUSE","-dQUIET","-dBATCH", f"-sOutputFile={str(dst)}", str(src)]
+        return ["-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
+                "-dPDFSETTINGS=/screen", "-dDetectDuplicateImages=true",
+                "-dNOPAUSE","-dQUIET","-dBATCH"]
     else:
-        cmd = [gs, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
-               "-dDetectDuplicateImages=true",
-               f"-dColorImageResolution={dpi}", f"-dGrayImageResolution={dpi}",
-               "-dNOPAUSE","-dQUIET","-dBATCH", f"-sOutputFile={str(dst)}", str(src)]
-    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return ["-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.5",
+                "-dDetectDuplicateImages=true",
+                f"-dColorImageResolution={dpi}", f"-dGrayImageResolution={dpi}",
+                "-dNOPAUSE","-dQUIET","-dBATCH"]
+
+GS_VM_THRESHOLD = "30000000 setvmthreshold"  # larger VM before gs garbage-collects
+
+def _gs_tuning(threads: int = 1):
+    return [f"-dNumRenderingThreads={threads}", "-dBufferSpace=100000000"]
+
+def gs_threads(max_workers: int):
+    # Split the cores between the gs processes running side by side
+    return max(1, (os.cpu_count() or 1) // max(1, max_workers))
+
+async def _run_gs(cmd):
+    # gs is already its own OS process; await it on the event loop instead of parking a thread on it
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        rc = await proc.wait()
+    except BaseException:
+        # Cancelled (Streamlit rerun/Stop): don't leave gs running after the loop is gone
+        try: proc.kill()
+        except ProcessLookupError: pass
+        await proc.wait()
+        raise
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
+
+async def ghostscript_compress(src: Path, dst: Path, preset: str, dpi: int = 150, threads: int = 1):
+    await _run_gs([GS, *_gs_args(preset, dpi), *_gs_tuning(threads), f"-sOutputFile={str(dst)}",
+                   "-c", GS_VM_THRESHOLD, "-f", str(src)])
+
+def _ps_str(p: Path):
+    # PostScript string literal for a path
+    s = str(p).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({s})"
+
+async def ghostscript_compress_batch(pairs, preset: str, dpi: int = 150, threads: int = 1):
+    # One gs process for several (src, dst) pairs: switch OutputFile between inputs
+    # so font/ICC/interpreter startup is paid once per cohort instead of once per file.
+    # Switching closes (finalizes) the previous dst, so outputs complete in order.
+    if len(pairs) == 1:
+        return await ghostscript_compress(*pairs[0], preset=preset, dpi=dpi, threads=threads)
+    ps = [GS_VM_THRESHOLD]
+    for i, (src, dst) in enumerate(pairs):
+        if i:
+            ps.append(f"<< /OutputFile {_ps_str(dst)} >> setpagedevice")
+        ps.append(f"{_ps_str(src)} run")
+    # Files named inside -c are not on the command line, so SAFER needs them permitted explicitly
+    permits = [f"--permit-file-read={src}" for src, _ in pairs] + \
+              [f"--permit-file-write={dst}" for _, dst in pairs]
+    await _run_gs([GS, *_gs_args(preset, dpi), *_gs_tuning(threads), *permits,
+                   f"-sOutputFile={str(pairs[0][1])}", "-c", " ".join(ps)])
 
 def pikepdf_optimize(src: Path, dst: Path):
     if not pikepdf: raise RuntimeError("pikepdf not installed")
     with pikepdf.open(str(src)) as pdf:
-        pdf.save(str(dst), optimize_streams=True, compress_streams=True, linearize=True)
+        pdf.remove_unreferenced_resources()  # drop images/fonts no page uses
+        pdf.save(str(dst), compress_streams=True, recompress_flate=True,
+                 object_stream_mode=pikepdf.ObjectStreamMode.generate, linearize=True)
 
-def compress_one(pdf_path: Path, out_dir: Path, mode: str, overwrite: bool, custom_dpi: int):
+async def _in_thread(fn, *args):
+    # asyncio.to_thread, except a cancelled caller still waits for the thread to return,
+    # so its temp file can be removed without the thread writing it again afterwards
+    fut = asyncio.get_running_loop().run_in_executor(None, fn, *args)
+    try:
+        return await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        await asyncio.wait([fut])
+        raise
+
+_PART_IDS = count()
+
+def _prepare(pdf_path: Path, out_dir: Path, overwrite: bool, size_before: int = None):
     out_dir = out_dir if out_dir else pdf_path.parent
     out_path = (pdf_path if overwrite else out_dir / (pdf_path.stem + "_compressed.pdf"))
     backup_path = None
     if overwrite:
         ensure_dir(Path("backups"))
-        backup_path = Path("backups") / f"{pdf_path.stem}_{int(time.time())}.pdf"
-        shutil.copy2(pdf_path, backup_path)
-    tmp = Path(tempfile.gettempdir()) / f"tmp_{pdf_path.stem}_{time.time()}.pdf"
-    size_before = pdf_path.stat().st_size
+        # Folder hash + ns timestamp: same-named PDFs from different folders never share a backup
+        tag = f"{zlib.crc32(str(pdf_path.parent).encode()):08x}_{time.time_ns()}"
+        backup_path = Path("backups") / f"{pdf_path.stem}_{tag}.pdf"
+        clone_file(pdf_path, backup_path)
+    # Temp file next to the destination so the final step is a rename, not a copy
+    ensure_dir(out_path.parent)
+    # pid + per-process counter: same-stem inputs share out_path but never a .part file
+    tmp = out_path.with_name(f"{out_path.name}.{os.getpid()}.{next(_PART_IDS)}.part")
+    return {"src": pdf_path, "out_path": out_path,
+            "backup_path": backup_path, "tmp": tmp,
+            "size_before": pdf_path.stat().st_size if size_before is None else size_before}
+
+def _finish(job, error=None):
+    pdf_path, out_path = job["src"], job["out_path"]
+    backup_path, tmp, size_before = job["backup_path"], job["tmp"], job["size_before"]
     status, note = "OK", ""
     try:
-        if has_ghostscript():
-            ghostscript_compress(pdf_path, tmp, preset=mode, dpi=custom_dpi)
-        else:
-            pikepdf_optimize(pdf_path, tmp)
-        ensure_dir(out_dir); shutil.move(tmp, out_path)
+        if error: raise error
+        try:
+            os.replace(tmp, out_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV: raise
+            shutil.move(tmp, out_path)
         size_after = out_path.stat().st_size
         ratio = (size_before - size_after) / size_before * 100 if size_before else 0
         return {"file": str(pdf_path), "before": size_before,"after": size_after,
@@ -127,6 +297,130 @@ def compress_one(pdf_path: Path, out_dir: Path, mode: str, overwrite: bool, cust
     finally:
         if tmp.exists(): tmp.unlink()
 
+def _discard(job):
+    if job["tmp"].exists(): job["tmp"].unlink()
+
+def _skip_result(pdf_path: Path, size_before: int, skip_below: int):
+    return {"file": str(pdf_path), "before": size_before, "after": size_before,
+            "saved_pct": 0.0, "status": "SKIP", "note": f"smaller than {human_size(skip_below)}",
+            "output": "", "backup": ""}
+
+async def compress_one(pdf_path: Path, out_dir: Path, mode: str, overwrite: bool, custom_dpi: int,
+                       size_before: int = None, threads: int = 1):
+    job = await asyncio.to_thread(_prepare, pdf_path, out_dir, overwrite, size_before)
+    try:
+        if has_ghostscript():
+            await ghostscript_compress(pdf_path, job["tmp"], preset=mode, dpi=custom_dpi, threads=threads)
+        else:
+            await _in_thread(pikepdf_optimize, pdf_path, job["tmp"])
+    except Exception as e:
+        return _finish(job, e)
+    except BaseException:
+        _discard(job); raise
+    return _finish(job)
+
+async def compress_batch(pdf_paths, out_dir: Path, mode: str, overwrite: bool, custom_dpi: int, sizes=None,
+                         threads: int = 1):
+    sizes = sizes or [None] * len(pdf_paths)
+    # Backups may be full copies; keep them off the event loop so other cohorts can start gs
+    jobs = await asyncio.gather(*[asyncio.to_thread(_prepare, p, out_dir, overwrite, n)
+                                  for p, n in zip(pdf_paths, sizes)])
+    results = []
+    try:
+        try:
+            await ghostscript_compress_batch([(j["src"], j["tmp"]) for j in jobs], preset=mode, dpi=custom_dpi,
+                                             threads=threads)
+            return [_finish(j) for j in jobs]
+        except Exception as e:
+            batch_error = e
+        # gs only opens a file's output after closing the previous one, so every job before
+        # the last .part that exists is complete; redo the rest alone so errors land on the right row
+        started = [k for k, j in enumerate(jobs) if j["tmp"].exists()]
+        first_retry = started[-1] if started else 0
+        why = f"exit {batch_error.returncode}" if isinstance(batch_error, subprocess.CalledProcessError) else batch_error
+        note = f"cohort gs failed ({why}); retried alone"
+        for k, j in enumerate(jobs):
+            if k < first_retry:
+                results.append(_finish(j))
+                continue
+            try:
+                await ghostscript_compress(j["src"], j["tmp"], preset=mode, dpi=custom_dpi, threads=threads)
+            except Exception as e:
+                results.append(_finish(j, e))
+                continue
+            res = _finish(j)
+            if res["status"] == "OK": res["note"] = note
+            results.append(res)
+        return results
+    except BaseException:
+        for j in jobs: _discard(j)
+        raise
+
+class ByteBudget:
+    """Limits the total size of PDFs being compressed at once."""
+    def __init__(self, limit: int):
+        self.limit, self.used = limit, 0
+        self.cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def hold(self, n: int):
+        n = min(n, self.limit)  # an oversized file may still run, just alone
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.used + n <= self.limit)
+            self.used += n
+        try:
+            yield
+        finally:
+            async with self.cond:
+                self.used -= n
+                self.cond.notify_all()
+
+def memory_budget():
+    # Half of currently free RAM; no cap when psutil is unavailable
+    return psutil.virtual_memory().available // 2 if psutil else sys.maxsize
+
+async def compress_many(files, out_dir: Path, mode: str, overwrite: bool, custom_dpi: int, max_workers: int,
+                        skip_below: int = SKIP_THRESHOLD):
+    # files: (path, size) pairs from scan_pdfs; size may be None to stat here.
+    # Yields (index into files, result) in completion order; at most max_workers gs processes in flight
+    sem = asyncio.Semaphore(max_workers)
+    # pikepdf jobs and _prepare run via to_thread; the stock executor caps at min(32, cpu+4)
+    # threads, which would quietly undercut a larger max_workers. asyncio.run shuts it down.
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+    budget = ByteBudget(memory_budget())
+    threads = gs_threads(max_workers)
+    todo = []
+    for i, (f, size) in enumerate(files):
+        f = Path(f)
+        if size is None: size = f.stat().st_size
+        if size < skip_below:
+            yield i, _skip_result(f, size, skip_below)
+        else:
+            todo.append((i, f, size))
+    # Largest first, so a big file doesn't start last and stall the batch
+    todo.sort(key=lambda t: -t[2])
+    if has_ghostscript():
+        # Small cohorts when there are few files, so every worker still gets some
+        k = max(1, min(GS_BATCH_SIZE, -(-len(todo) // max_workers)))
+        async def run(cohort):
+            # A cohort's gs handles one file at a time, so its largest file is what it holds
+            async with sem, budget.hold(max(size for _, _, size in cohort)):
+                res = await compress_batch([f for _, f, _ in cohort], out_dir, mode, overwrite, custom_dpi,
+                                           sizes=[size for _, _, size in cohort], threads=threads)
+            return zip([i for i, _, _ in cohort], res)
+        # Deal the size-sorted files round-robin so the largest ones land in different
+        # cohorts (and run in parallel) instead of queueing inside the first gs
+        n = -(-len(todo) // k)
+        tasks = [run(todo[c::n]) for c in range(n)]
+    else:
+        async def run(i, f, size):
+            async with sem, budget.hold(size):
+                return [(i, await compress_one(f, out_dir, mode, overwrite, custom_dpi, size, threads))]
+        tasks = [run(*t) for t in todo]
+    for coro in asyncio.as_completed(tasks):
+        for item in await coro:
+            yield item
+
 # ---------------- Streamlit UI ----------------
 st.set_page_config(page_title="PDF Folder Compressor", layout="wide")
 st.title("PDF Folder Compressor")
@@ -146,7 +440,8 @@ with st.sidebar:
     custom_dpi = 150
     if preset=="custom":
         custom_dpi = st.slider("Custom DPI",72,300,150,10)
-    max_workers = st.slider("Max workers",1,16,4,1)
+    max_workers = st.slider("Max workers",1,16,default_workers(),1)
+    skip_kb = st.number_input("Skip files smaller than (KB)", min_value=0, value=SKIP_THRESHOLD // 1024, step=50)
 
 st.markdown("#### Source")
 source_mode = st.radio("Source type", ["Folder(s)","Upload"], horizontal=True)
@@ -162,7 +457,7 @@ if source_mode=="Folder(s)":
         paths = normalize_paths(folders_raw)
         st.session_state["scan_paths"] = [str(p) for p in paths]
         files, errs = scan_pdfs(paths, recursive=recursive)
-        st.session_state["files_to_process"] = [str(f.resolve()) for f in files]
+        st.session_state["files_to_process"] = [(str(f), n) for f, n in files]  # already resolved by scan_pdfs
         st.session_state["last_scan_errors"] = errs
         st.success(f"Found {len(files)} PDF(s).")
     if col2.button("Clear scan results"):
@@ -177,8 +472,8 @@ else:
         files_saved = []
         for uf in uploaded:
             p=tmpdir/uf.name
-            with open(p,"wb") as f: f.write(uf.getbuffer())
-            files_saved.append(str(p))
+            with open(p,"wb") as f: shutil.copyfileobj(uf, f, length=1024*1024)
+            files_saved.append((str(p), uf.size))
         st.session_state["files_to_process"] = files_saved
         st.session_state["last_scan_errors"] = []
         st.session_state["scan_paths"] = [str(tmpdir)]
@@ -190,7 +485,7 @@ with st.expander("Diagnostics (paths & errors)"):
     st.write("Scan paths:", st.session_state.get("scan_paths", []))
     st.write("Files found:", len(st.session_state.get("files_to_process", [])))
     if st.session_state.get("files_to_process"):
-        st.write(st.session_state["files_to_process"][:50])  # preview up to 50
+        st.write([p for p, _ in st.session_state["files_to_process"][:50]])  # preview up to 50
     if st.session_state.get("last_scan_errors"):
         st.warning("Issues:")
         for e in st.session_state["last_scan_errors"]:
@@ -198,36 +493,55 @@ with st.expander("Diagnostics (paths & errors)"):
 
 start = st.button("Start compression", type="primary")
 if start:
-    files = [Path(p) for p in st.session_state.get("files_to_process", [])]
+    files = [(Path(p), n) for p, n in st.session_state.get("files_to_process", [])]
+    if overwrite:
+        # This run rewrites the sources, so the scanned sizes go stale; later runs stat afresh.
+        # Cleared before starting so an interrupted run can't leave them behind either.
+        st.session_state["files_to_process"] = [(str(p), None) for p, _ in files]
     if not files:
         st.warning("No files to process. Run **Scan folders** or upload PDFs.")
     else:
         # Ensure output directory exists
         ensure_dir(Path(out_dir_str))
-        results=[]
-        from concurrent.futures import ThreadPoolExecutor, as_completed
         total = len(files)
+        results=[None]*total
+        max_workers = min(max_workers, total)
         progress = st.progress(0.0)
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            futs=[ex.submit(compress_one,Path(f),out_dir,preset,overwrite,custom_dpi) for f in files]
+        st.subheader("Results")
+        table_ph = st.empty()
+        ensure_dir(Path("reports"))
+        report_path = Path("reports")/f"report_{int(time.time())}.csv"
+        order = []  # indices in completion order; both tables show the last DISPLAY_MAX_ROWS of these
+        async def run_all(writer, fp):
             done = 0
-            for fut in as_completed(futs):
-                results.append(fut.result())
+            last_render = 0.0
+            async for i, res in compress_many(files, out_dir, preset, overwrite, custom_dpi, max_workers,
+                                              skip_below=int(skip_kb) * 1024):
+                results[i] = res
+                order.append(i)
+                writer.writerow(res)
                 done += 1
+                if done % REPORT_FLUSH_EVERY == 0: fp.flush()
                 progress.progress(done/total)
-        import pandas as pd
-        df=pd.DataFrame(results)
+                # Live table, but at most ~2 redraws/s so rendering doesn't dominate
+                now = time.monotonic()
+                if now - last_render > 0.5 or done == total:
+                    table_ph.dataframe(results_frame([results[j] for j in order[-DISPLAY_MAX_ROWS:]]),
+                                       use_container_width=True)
+                    last_render = now
+        # Rows are written as they finish, so the report survives a crash mid-batch
+        with open(report_path, "w", newline="", encoding="utf-8") as fp:
+            writer = csv.DictWriter(fp, fieldnames=RESULT_COLUMNS)
+            writer.writeheader()
+            asyncio.run(run_all(writer, fp))
+        shown = [results[j] for j in sorted(order[-DISPLAY_MAX_ROWS:])]  # same rows, back in scan order
+        df=results_frame(shown)
         if not df.empty:
-            df_show = df.copy()
-            df_show["before"]=df_show["before"].apply(human_size)
-            df_show["after"]=df_show["after"].apply(human_size)
-            st.subheader("Results")
-            st.dataframe(df_show,use_container_width=True)
-            ensure_dir(Path("reports"))
-            report_path = Path("reports")/f"report_{int(time.time())}.csv"
-            df.to_csv(report_path, index=False)
+            table_ph.dataframe(df,use_container_width=True)
+            if total > DISPLAY_MAX_ROWS:
+                st.caption(f"Showing the last {DISPLAY_MAX_ROWS} of {total} files to finish; the report has all of them.")
             st.success(f"Report saved: {report_path}")
         else:
-            st.info("No results to show.")
+            table_ph.info("No results to show.")
 else:
     st.caption("Scan or upload files first, then click **Start compression**.")
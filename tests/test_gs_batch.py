@@ -0,0 +1,43 @@
+import asyncio, shutil, subprocess, sys
+from pathlib import Path
+import pytest
+
+pytest.importorskip("streamlit")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import app  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not shutil.which(app.GS), reason="Ghostscript not installed")
+
+def make_pdf(path: Path, label: str):
+    subprocess.run([app.GS, "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pdfwrite", f"-sOutputFile={path}",
+                    "-c", f"/Helvetica findfont 40 scalefont setfont 100 400 moveto ({label}) show showpage"],
+                   check=True)
+
+def pdf_text(path: Path):
+    return subprocess.run([app.GS, "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=txtwrite", "-sOutputFile=-", str(path)],
+                          check=True, capture_output=True, text=True).stdout
+
+def test_batch_writes_each_dst_separately(tmp_path):
+    # Under default SAFER, one gs must still switch /OutputFile between inputs
+    labels = ["alpha", "bravo", "charlie"]
+    pairs = []
+    for label in labels:
+        make_pdf(tmp_path / f"{label}.pdf", label)
+        pairs.append((tmp_path / f"{label}.pdf", tmp_path / f"{label}_out.pdf"))
+    asyncio.run(app.ghostscript_compress_batch(pairs, "balanced"))
+    for label, (_, dst) in zip(labels, pairs):
+        text = pdf_text(dst)
+        assert label in text
+        assert not any(other in text for other in labels if other != label)
+
+def test_failed_cohort_retries_only_unfinished_files(tmp_path):
+    make_pdf(tmp_path / "good.pdf", "good")
+    (tmp_path / "bad.pdf").write_bytes(b"not a pdf")
+    make_pdf(tmp_path / "late.pdf", "late")
+    files = [tmp_path / "good.pdf", tmp_path / "bad.pdf", tmp_path / "late.pdf"]
+    res = asyncio.run(app.compress_batch(files, tmp_path / "out", "balanced", False, 150))
+    assert [r["status"] for r in res] == ["OK", "ERROR", "OK"]
+    assert res[0]["note"] == ""  # finished inside the cohort run, not redone
+    assert "retried alone" in res[2]["note"]
+    assert "late" in pdf_text(Path(res[2]["output"]))
+    assert not list((tmp_path / "out").glob("*.part"))